@@ -1,22 +1,33 @@
+import asyncio
 import json
+import re
 import subprocess
+import threading
 from datetime import timedelta
-from typing import Any, Dict, Optional
+from functools import lru_cache, partial
+from typing import Any, Dict, List, Optional, Tuple
 
 import requests
 from click import Context
-from jinja2 import Environment
+from jinja2 import Environment, Template
+from requests.adapters import HTTPAdapter
 from typing_extensions import Self
 
 from ch_tools.common import logging
-from ch_tools.common.utils import version_ge
+from ch_tools.common.utils import get_fqdn, version_ge
 
 from ..config import get_clickhouse_config
 from ..config.clickhouse import ClickhousePort
 from .error import ClickhouseError
+from .query_cache import QueryResultCache, ServerQueryCache
 from .retry import retry
 from .utils import _format_str_imatch, _format_str_match
 
+try:
+    import orjson
+except ImportError:
+    orjson = None  # type: ignore[assignment]
+
 PORTS_PRIORITY = [
     ClickhousePort.HTTPS,
     ClickhousePort.HTTP,
@@ -24,8 +35,25 @@ PORTS_PRIORITY = [
     ClickhousePort.TCP,
 ]
 
+HTTP_POOL_CONNECTIONS = 4
+HTTP_POOL_MAXSIZE = 16
+
+# HTTP sessions shared between client instances to reuse established connections.
+_SESSION_CACHE: Dict[Tuple[str, Optional[str], bool], requests.Session] = {}
+
+# Formats requested from server instead of the ones specified by caller.
+# Query results are converted to the originally requested format on client side.
+_PREFERRED_FORMATS = {
+    "JSON": "JSONCompact",
+}
+
+RESULT_CACHE_MAXSIZE = 128
+RESULT_CACHE_TTL = 30
+
 
-class ClickhouseClient:
+# Besides connection parameters, the client keeps HTTP session and caches of query
+# settings and results.
+class ClickhouseClient:  # pylint: disable=too-many-instance-attributes
     """
     ClickHouse client wrapper.
     """
@@ -33,7 +61,7 @@ class ClickhouseClient:
     def __init__(
         self: Self,
         *,
-        host: str,
+        host: Optional[str] = None,
         insecure: bool = False,
         user: Optional[str] = None,
         password: Optional[str] = None,
@@ -41,8 +69,10 @@ class ClickhouseClient:
         cert_path: Optional[str] = None,
         timeout: int,
         settings: Optional[Dict[str, Any]] = None,
+        query_cache: bool = False,
+        result_cache_ttl: float = RESULT_CACHE_TTL,
     ):
-        self.host = host
+        self.host = host or get_fqdn()
         self.insecure = insecure
         self.user = user
         self.ports = ports
@@ -51,15 +81,41 @@ class ClickhouseClient:
         self._settings = settings or {}
         self._timeout = timeout
         self._ch_version = None
+        self._server_query_cache = ServerQueryCache(query_cache)
+        # Guards server version shared by concurrent queries (see aquery).
+        self._version_lock = threading.Lock()
+        self._result_cache = QueryResultCache(RESULT_CACHE_MAXSIZE, result_cache_ttl)
+        self._session = self._create_session()
+
+    def _create_session(self) -> requests.Session:
+        """
+        Return HTTP session with connection pooling and keep-alive enabled.
+        """
+        key = (self.host, self.user, self.insecure)
+        session = _SESSION_CACHE.get(key)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=HTTP_POOL_CONNECTIONS,
+                pool_maxsize=HTTP_POOL_MAXSIZE,
+                max_retries=0,
+            )
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers["Connection"] = "keep-alive"
+            _SESSION_CACHE[key] = session
+
+        return session
 
     def get_clickhouse_version(self):
         """
         Get ClickHouse server version.
         """
-        if self._ch_version is None:
-            self._ch_version = self.query("SELECT version()")
+        with self._version_lock:
+            if self._ch_version is None:
+                self._ch_version = self.query("SELECT version()")
 
-        return self._ch_version
+            return self._ch_version
 
     def get_uptime(self):
         """
@@ -88,7 +144,7 @@ class ClickhouseClient:
         verify = self.cert_path if port == ClickhousePort.HTTPS else None
         try:
             if query:
-                response = requests.post(
+                response = self._session.post(
                     url,
                     params={
                         **self._settings,
@@ -103,7 +159,7 @@ class ClickhouseClient:
                 )
             else:
                 # Used for ping
-                response = requests.get(
+                response = self._session.get(
                     url,
                     headers=headers,
                     timeout=timeout,
@@ -117,7 +173,7 @@ class ClickhouseClient:
                 return response
 
             if format_ in ("JSON", "JSONCompact"):
-                return response.json()
+                return _json_loads(response.content)
 
             return response.text.strip()
         except requests.exceptions.HTTPError as e:
@@ -155,12 +211,10 @@ class ClickhouseClient:
                 '"{0}" failed with: {1}'.format(masked_cmd, stderr.decode())
             )
 
-        response = stdout.decode().strip()
-
         if format_ in ("JSON", "JSONCompact"):
-            return json.loads(response)
+            return _json_loads(stdout)
 
-        return response.strip()
+        return stdout.decode().strip()
 
     @retry(requests.exceptions.ConnectionError)
     def query(
@@ -175,18 +229,24 @@ class ClickhouseClient:
         stream: bool = False,
         settings: Optional[dict] = None,
         port: Optional[ClickhousePort] = None,
+        query_cache: Optional[bool] = None,
+        cache: bool = False,
     ) -> Any:
         """
         Execute query.
+
+        Server-side query cache is used if query_cache is set, or if it's omitted
+        and the client was created with query_cache enabled.
+
+        If cache is set, the result is cached on client side and identical queries
+        are served from the cache until it expires. It must be used for read-only
+        queries only.
         """
         if query_args:
             query = self.render_query(query, **query_args)
 
-        if format_:
-            query += f" FORMAT {format_}"
-
         if echo:
-            print(query, "\n")
+            print(f"{query} FORMAT {format_}" if format_ else query, "\n")
 
         if dry_run:
             return None
@@ -195,6 +255,8 @@ class ClickhouseClient:
             timeout = self._timeout
 
         per_query_settings = settings or {}
+        if query_cache is None:
+            query_cache = self._server_query_cache.enabled
 
         if port is None:
             for i_port in PORTS_PRIORITY:
@@ -205,19 +267,95 @@ class ClickhouseClient:
             if port is None:
                 raise UserWarning(2, "Can't find any port in clickhouse-server config")
 
-        logging.debug("Executing query: {}", query)
-        if port in [ClickhousePort.HTTPS, ClickhousePort.HTTP]:
-            return self._execute_http(
+        # Request more compact format from server if the result is not returned as is.
+        wire_format = format_
+        if format_ and not stream:
+            wire_format = _PREFERRED_FORMATS.get(str(format_), format_)
+
+        if wire_format:
+            query += f" FORMAT {wire_format}"
+
+        # Results are cached in wire format, so the key doesn't depend on requested one.
+        cache_key = None
+        found = False
+        if cache and query and not stream and post_data is None:
+            cache_key = (
+                query,
+                port,
+                tuple(sorted({**self._settings, **per_query_settings}.items())),
+            )
+            found, result = self._result_cache.get(cache_key)
+            if found:
+                logging.debug("Using cached result of query: {}", query)
+
+        if not found:
+            result = self._execute(
                 query,
-                format_,
+                wire_format,
                 post_data,
                 timeout,
                 stream,
                 per_query_settings,
+                query_cache,
                 port,
             )
+            if cache_key is not None:
+                self._result_cache.put(cache_key, result)
+
+        if wire_format != format_:
+            result = _convert_from_json_compact(result)
+
+        return result
+
+    def _execute(
+        self,
+        query,
+        format_,
+        post_data,
+        timeout,
+        stream,
+        per_query_settings,
+        query_cache,
+        port,
+    ):
+        logging.debug("Executing query: {}", query)
+        if port in [ClickhousePort.HTTPS, ClickhousePort.HTTP]:
+            # Query cache settings are sent optimistically, the query is retried without
+            # them if server doesn't support them.
+            while True:
+                cache_settings = (
+                    self._server_query_cache.settings if query and query_cache else {}
+                )
+                query_settings = {**cache_settings, **per_query_settings}
+                try:
+                    return self._execute_http(
+                        query,
+                        format_,
+                        post_data,
+                        timeout,
+                        stream,
+                        query_settings,
+                        port,
+                    )
+                except ClickhouseError as e:
+                    if not self._server_query_cache.discard_rejected(e, cache_settings):
+                        raise
+                    logging.debug(
+                        "Retrying query without unsupported query cache settings"
+                    )
+
         return self._execute_tcp(query, format_, port)
 
+    async def aquery(self: Self, query: str, **kwargs: Any) -> Any:
+        """
+        Execute query asynchronously. Accepts the same arguments as query().
+
+        The query is executed in the default executor of event loop with the same retry
+        policy, so queries to several hosts can be run concurrently with asyncio.gather().
+        """
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(None, partial(self.query, query, **kwargs))
+
     def query_json_data(
         self: Self,
         query: str,
@@ -230,6 +368,8 @@ class ClickhouseClient:
         stream: bool = False,
         settings: Optional[dict] = None,
         port: Optional[ClickhousePort] = None,
+        query_cache: Optional[bool] = None,
+        cache: bool = False,
     ) -> Any:
         """
         Execute ClickHouse query formatted as JSON and return data.
@@ -249,19 +389,60 @@ class ClickhouseClient:
             stream=stream,
             settings=settings,
             port=port,
+            query_cache=query_cache,
+            cache=cache,
         )["data"]
 
-    def render_query(self, query, **kwargs):
-        env = Environment()
+    def batch(
+        self: Self,
+        queries: List[Tuple[str, str]],
+        timeout: Optional[int] = None,
+        settings: Optional[dict] = None,
+        query_cache: Optional[bool] = None,
+    ) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Execute several SELECT queries in a single request and return their data by query name.
+
+        Query options are applied to the request as a whole.
+        """
+        subqueries = []
+        for name, query in queries:
+            if "'" in name or "\\" in name:
+                raise ValueError(f"Invalid query name: {name}")
+            subqueries.append(
+                f"SELECT '{name}' AS _check_name,"
+                f" formatRowNoNewline('JSONEachRow', *) AS _check_row FROM ({query})"
+            )
 
-        env.globals["version_ge"] = lambda version: version_ge(
-            self.get_clickhouse_version(), version
+        response = self.query(
+            " UNION ALL ".join(subqueries),
+            format_="JSONEachRow",
+            timeout=timeout,
+            settings=settings,
+            query_cache=query_cache,
         )
-        env.globals["format_str_match"] = _format_str_match
-        env.globals["format_str_imatch"] = _format_str_imatch
 
-        template = env.from_string(query)
-        return template.render(kwargs)
+        result: Dict[str, List[Dict[str, Any]]] = {name: [] for name, _ in queries}
+        for line in response.splitlines():
+            item = _json_loads(line)
+            result[item["_check_name"]].append(_json_loads(item["_check_row"]))
+
+        return result
+
+    def render_query(self, query, **kwargs):
+        rendered_query = _render_simple_query(query, kwargs)
+        if rendered_query is not None:
+            return rendered_query
+
+        template = _compile_query_template(query)
+        return template.render(
+            {
+                "version_ge": lambda version: version_ge(
+                    self.get_clickhouse_version(), version
+                ),
+                **kwargs,
+            }
+        )
 
     def check_port(self, port: ClickhousePort) -> bool:
         return port in self.ports
@@ -273,6 +454,86 @@ class ClickhouseClient:
         return self.query(query=None, port=port)
 
 
+def _convert_from_json_compact(result: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Convert JSONCompact query result to JSON one.
+    """
+    names = [column["name"] for column in result["meta"]]
+    result["data"] = [dict(zip(names, row)) for row in result["data"]]
+    if "totals" in result:
+        result["totals"] = dict(zip(names, result["totals"]))
+    if "extremes" in result:
+        result["extremes"] = {
+            key: dict(zip(names, row)) for key, row in result["extremes"].items()
+        }
+    return result
+
+
+# Numbers that might not fit into 64-bit integer. orjson converts such numbers to float
+# losing precision, so documents containing them are deserialized with json module.
+_BIG_INT_RE = r"[\[:,]\s*(?:-\d{19}|\d{20})"
+_BIG_INT_STR_RE = re.compile(_BIG_INT_RE)
+_BIG_INT_BYTES_RE = re.compile(_BIG_INT_RE.encode())
+
+
+def _json_loads(data: Any) -> Any:
+    """
+    Deserialize JSON document. orjson is used if it's available as it's considerably faster.
+    """
+    if orjson is not None:
+        big_int_re = _BIG_INT_STR_RE if isinstance(data, str) else _BIG_INT_BYTES_RE
+        if not big_int_re.search(data):
+            try:
+                return orjson.loads(data)
+            except orjson.JSONDecodeError:
+                # Fall back to json module, e.g. to handle invalid UTF-8.
+                pass
+
+    if isinstance(data, bytes):
+        # ClickHouse doesn't validate UTF-8 in JSON output by default, so binary strings
+        # are passed as is.
+        data = data.decode("utf-8", errors="replace")
+
+    return json.loads(data)
+
+
+_SIMPLE_TEMPLATE_VAR_RE = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+_JINJA_LITERALS = frozenset(("true", "false", "none", "True", "False", "None"))
+
+
+def _render_simple_query(query: str, variables: Dict[str, Any]) -> Optional[str]:
+    """
+    Render query template that contains only plain variable substitutions without Jinja.
+    Return None if the template requires Jinja to be rendered.
+    """
+    # Jinja normalizes line endings of template data.
+    if "{%" in query or "{#" in query or "\r" in query:
+        return None
+
+    names = _SIMPLE_TEMPLATE_VAR_RE.findall(query)
+    if query.count("{{") != len(names):
+        return None
+    for name in names:
+        if name not in variables or name in _JINJA_LITERALS:
+            return None
+
+    result = _SIMPLE_TEMPLATE_VAR_RE.sub(lambda m: str(variables[m.group(1)]), query)
+    # Follow Jinja behavior of removing a single trailing newline.
+    if result.endswith("\n"):
+        result = result[:-1]
+    return result
+
+
+_JINJA_ENV = Environment()
+_JINJA_ENV.globals["format_str_match"] = _format_str_match
+_JINJA_ENV.globals["format_str_imatch"] = _format_str_imatch
+
+
+@lru_cache(maxsize=256)
+def _compile_query_template(query: str) -> Template:
+    return _JINJA_ENV.from_string(query)
+
+
 def clickhouse_client(ctx: Context) -> ClickhouseClient:
     """
     Return ClickHouse client from the context if it exists.
@@ -1,5 +1,8 @@
 import re
 
+_QUERY_WS_RE = re.compile(r"\s*\n\s*")
+_ERROR_CODE_RE = re.compile(r"Code: (\d+)")
+
 
 class ClickhouseError(Exception):
     """
@@ -7,6 +10,18 @@ class ClickhouseError(Exception):
     """
 
     def __init__(self, query, response):
-        self.query = re.sub(r"\s*\n\s*", " ", query.strip())
+        self.query = _QUERY_WS_RE.sub(" ", query.strip())
         self.response = response
         super().__init__(f"{self.response.text.strip()}\n\nQuery: {self.query}")
+
+    @property
+    def code(self):
+        """
+        ClickHouse error code or None if it can't be determined.
+        """
+        code = self.response.headers.get("X-ClickHouse-Exception-Code")
+        if code is None:
+            match = _ERROR_CODE_RE.match(self.response.text)
+            code = match and match.group(1)
+
+        return int(code) if code else None
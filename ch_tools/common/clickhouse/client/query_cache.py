@@ -0,0 +1,123 @@
+import threading
+import time
+from collections import OrderedDict
+from copy import deepcopy
+from typing import Any, Dict, Hashable, Tuple
+
+from .error import ClickhouseError
+
+QUERY_CACHE_TTL = 30
+
+# Settings enabling server-side query cache. The last one is required to cache results
+# of queries to system tables in ClickHouse 24.4+.
+QUERY_CACHE_SETTINGS = {
+    "use_query_cache": 1,
+    "query_cache_ttl": QUERY_CACHE_TTL,
+    "query_cache_system_table_handling": "save",
+}
+
+UNKNOWN_SETTING_ERROR_CODE = 115
+READONLY_ERROR_CODE = 164
+
+
+class QueryResultCache:
+    """
+    Thread-safe LRU cache of query results with time-based expiration.
+    """
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._items: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Tuple[bool, Any]:
+        """
+        Return tuple (found, value) for the key.
+        """
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return False, None
+
+            expire_time, value = item
+            if expire_time <= time.monotonic():
+                del self._items[key]
+                return False, None
+
+            self._items.move_to_end(key)
+
+        return True, _copy_if_mutable(value)
+
+    def put(self, key: Hashable, value: Any) -> None:
+        with self._lock:
+            self._items[key] = (time.monotonic() + self._ttl, _copy_if_mutable(value))
+            self._items.move_to_end(key)
+            while len(self._items) > self._maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+
+
+class ServerQueryCache:
+    """
+    Settings of ClickHouse server-side query cache.
+
+    Settings are sent to server optimistically. The ones rejected by server are dropped,
+    so subsequent queries are executed without them.
+    """
+
+    def __init__(self, enabled: bool) -> None:
+        self.enabled = enabled
+        # The dict is replaced instead of being modified in place as it's shared with
+        # concurrently executed queries.
+        self.settings: Dict[str, Any] = dict(QUERY_CACHE_SETTINGS)
+        self._lock = threading.Lock()
+
+    def discard_rejected(
+        self, error: ClickhouseError, sent_settings: Dict[str, Any]
+    ) -> bool:
+        """
+        Drop query cache settings rejected by server. Return True if the query can be
+        retried with the remaining settings.
+        """
+        if not sent_settings:
+            return False
+
+        code = error.code
+        if code == READONLY_ERROR_CODE:
+            # Settings can't be changed by user in readonly mode.
+            unknown = list(sent_settings)
+        elif code == UNKNOWN_SETTING_ERROR_CODE:
+            unknown = [name for name in sent_settings if name in error.response.text]
+            if not unknown:
+                # The error is caused by other settings of the query.
+                return False
+        else:
+            return False
+
+        with self._lock:
+            # Settings might be already updated by concurrent query.
+            if self.settings is not sent_settings:
+                return True
+
+            if unknown == ["query_cache_system_table_handling"]:
+                # Server supports query cache but doesn't restrict caching of system tables.
+                self.settings = {
+                    name: value
+                    for name, value in sent_settings.items()
+                    if name != "query_cache_system_table_handling"
+                }
+            else:
+                self.settings = {}
+
+        return True
+
+
+def _copy_if_mutable(value: Any) -> Any:
+    if isinstance(value, (str, bytes, int, float, bool, type(None))):
+        return value
+
+    return deepcopy(value)
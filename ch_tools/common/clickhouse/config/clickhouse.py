@@ -31,18 +31,26 @@ class ClickhouseConfig:
     def __init__(self, config, preprocessed):
         self._config = config
         self.preprocessed = preprocessed
-
-    @property
-    def _config_root(self) -> dict:
-        return first_value(self._config)
+        # Config is not modified after loading, so derived sections are computed once.
+        self._config_root: dict = first_value(config)
+        self._macros = {
+            key: value
+            for key, value in (self._config_root.get("macros") or {}).items()
+            if not key.startswith("@")
+        }
+        self._zookeeper = ClickhouseZookeeperConfig(
+            self._config_root.get("zookeeper") or {}
+        )
+        self._storage_configuration = ClickhouseStorageConfiguration(
+            self._config_root.get("storage_configuration") or {}
+        )
 
     @property
     def macros(self):
         """
         ClickHouse macros.
         """
-        macros = self._config_root.get("macros", {})
-        return {key: value for key, value in macros.items() if not key.startswith("@")}
+        return self._macros
 
     @property
     def cluster_name(self):
@@ -53,13 +61,11 @@ class ClickhouseConfig:
         """
         ZooKeeper configuration.
         """
-        return ClickhouseZookeeperConfig(self._config_root.get("zookeeper", {}))
+        return self._zookeeper
 
     @property
     def storage_configuration(self) -> ClickhouseStorageConfiguration:
-        return ClickhouseStorageConfiguration(
-            self._config_root.get("storage_configuration", {})
-        )
+        return self._storage_configuration
 
     @property
     def ports(self) -> Dict[ClickhousePort, int]:
@@ -21,9 +21,10 @@ class ClickhouseStorageConfiguration:
 
     def __init__(self, config: dict) -> None:
         self._config = config
+        self._disks: dict = config.get("disks") or {}
 
     def has_disk(self, name: str) -> bool:
-        return name in self._config.get("disks", {})
+        return name in self._disks
 
     def s3_disk_configuration(
         self, name: str, bucket_name_prefix: str
@@ -31,7 +32,7 @@ class ClickhouseStorageConfiguration:
         if not self.has_disk(name):
             raise RuntimeError(f"Config section for disk '{name}' is not found")
 
-        disk = self._config["disks"][name]
+        disk = self._disks[name]
 
         if disk["type"] != "s3":
             raise TypeError(f"Unsupported object storage type {disk['type']}")
@@ -54,7 +55,7 @@ class ClickhouseStorageConfiguration:
         )
 
     def get_disk_config(self, disk: str) -> dict:
-        return (self._config.get("disks", {})).get(disk, {})
+        return self._disks.get(disk, {})
 
 
 def _parse_endpoint(endpoint: str, bucket_name_prefix: str) -> tuple:
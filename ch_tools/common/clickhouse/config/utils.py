@@ -1,15 +1,22 @@
+import os
 import os.path
-from copy import deepcopy
-from typing import MutableMapping
+import sys
+from functools import lru_cache
+from typing import Any, Dict, List, Mapping, Tuple
 
 import xmltodict
+from lxml import etree
 
-from ch_tools.common.utils import first_value
+from ch_tools.common.utils import first_key, first_value
+
+_SECRET_KEYS = frozenset(("password", "secret_access_key", "header", "identity"))
 
 
 def load_config(config_path, configd_dir="config.d"):
     """
     Load ClickHouse config file.
+
+    The result can share sections with other loaded configs, so it must not be modified.
     """
     # Load main config file.
     config = _load_config(config_path)
@@ -17,16 +24,20 @@ def load_config(config_path, configd_dir="config.d"):
     # Load config files from config.d/ directory.
     configd_path = os.path.join(os.path.dirname(config_path), configd_dir)
     if os.path.exists(configd_path):
-        for file in os.listdir(configd_path):
-            file_path = os.path.join(configd_path, file)
-            _merge_configs(config, _load_config(file_path))
+        file_paths = [
+            os.path.join(configd_path, file) for file in os.listdir(configd_path)
+        ]
+        if file_paths:
+            config = _merge_configs(config, map(_load_config, file_paths))
 
     # Process includes.
     root_section = first_value(config)
     include_file = root_section.get("include_from")
     if include_file:
         include_config = first_value(_load_config(include_file))
-        _apply_config_directives(root_section, include_config)
+        config = {
+            first_key(config): _apply_config_directives(root_section, include_config)
+        }
 
     return config
 
@@ -34,54 +45,311 @@ def load_config(config_path, configd_dir="config.d"):
 def dump_config(config, *, mask_secrets=True, xml_format=False):
     """
     Dump ClickHouse config.
+
+    The result can share unmodified sections with the passed config, so it must not be modified.
     """
-    result = deepcopy(config)
+    result = config
 
     if mask_secrets:
-        _mask_secrets(result)
+        result = _mask_secrets_cow(config)
 
     if xml_format:
-        result = xmltodict.unparse(result, pretty=True)
+        result = _dump_xml(result)
 
     return result
 
 
 def _load_config(config_path):
-    with open(config_path, "r", encoding="utf-8") as file:
-        return xmltodict.parse(file.read())
+    """
+    Load config file. The result is shared between callers and must not be modified.
+    """
+    stat = os.stat(config_path)
+    return _parse_config(config_path, stat.st_mtime_ns, stat.st_size)
 
 
-def _merge_configs(main_config, additional_config):
-    for key, value in additional_config.items():
-        if key not in main_config:
-            main_config[key] = value
-            continue
+@lru_cache(maxsize=32)
+def _parse_config(config_path, _mtime_ns, _size):
+    """
+    Parse config file into dict of the same structure as xmltodict produces.
+    File modification time and size are the part of cache key.
 
-        if isinstance(main_config[key], dict) and isinstance(value, dict):
-            _merge_configs(main_config[key], value)
-            continue
+    The file is parsed incrementally. Processed elements are removed from the tree
+    right after conversion, so the whole XML tree is never kept in memory along with
+    the result.
+    """
+    result: Dict[str, Any] = {}
+    # Items of currently open elements: converted attributes and children, text parts
+    # and namespace map.
+    stack: List[Tuple[Dict[str, Any], List[str], Mapping]] = []
+    with open(config_path, "rb") as file:
+        for event, element in etree.iterparse(
+            file, events=("start", "end"), remove_comments=True, remove_pis=True
+        ):
+            if event == "start":
+                parent_nsmap = stack[-1][2] if stack else {}
+                nsmap = element.nsmap
+                stack.append(
+                    (_element_attributes(element, nsmap, parent_nsmap), [], nsmap)
+                )
+                continue
+
+            node, text_parts, _ = stack.pop()
+            text_parts.insert(0, element.text or "")
+            # Tails of removed children are already in text parts.
+            text_parts.extend(child.tail or "" for child in element)
+            value = _element_value(node, "".join(text_parts).strip() or None)
+
+            parent = stack[-1][0] if stack else result
+            name = _element_name(element)
+            if name not in parent:
+                parent[name] = value
+            elif isinstance(parent[name], list):
+                parent[name].append(value)
+            else:
+                parent[name] = [parent[name], value]
+
+            # Free the element and its preceding siblings. The tail of the element
+            # may be incomplete yet, so the element itself is left in the tree until
+            # the next sibling or the parent is processed.
+            element.clear(keep_tail=True)
+            if stack:
+                parent_element = element.getparent()
+                while element.getprevious() is not None:
+                    stack[-1][1].append(parent_element[0].tail or "")
+                    del parent_element[0]
+
+    return result
+
+
+def _element_name(element):
+    tag = element.tag
+    if tag[0] != "{":
+        return sys.intern(tag)
+
+    qname = etree.QName(tag)
+    if element.prefix:
+        return f"{element.prefix}:{qname.localname}"
+    return qname.localname
+
+
+def _element_attributes(element, nsmap, parent_nsmap):
+    result: Dict[str, Any] = {}
+
+    if nsmap:
+        for prefix, uri in nsmap.items():
+            if parent_nsmap.get(prefix) != uri:
+                result["@xmlns" if prefix is None else f"@xmlns:{prefix}"] = uri
+
+    for name, value in element.attrib.items():
+        if name[0] == "{":
+            qname = etree.QName(name)
+            prefix = _find_prefix(nsmap, qname.namespace)
+            name = f"{prefix}:{qname.localname}" if prefix else qname.localname
+        result[sys.intern(f"@{name}")] = value
+
+    return result
+
+
+def _element_value(node, text):
+    if not node:
+        return text
+
+    if text is not None:
+        node["#text"] = text
+
+    return node
+
+
+def _find_prefix(nsmap, namespace):
+    if namespace is None:
+        return None
+    for prefix, uri in nsmap.items():
+        if prefix is not None and uri == namespace:
+            return prefix
+    return None
+
+
+def _dump_xml(config):
+    """
+    Serialize config into XML document. It's the inverse of _parse_config.
+    """
+    try:
+        root = _dict_to_etree(config)
+    except ValueError:
+        # Config can't be represented with lxml elements (e.g. element names are not valid
+        # XML names), xmltodict is more permissive here.
+        return xmltodict.unparse(config, pretty=True)
+
+    return etree.tostring(
+        root, pretty_print=True, xml_declaration=True, encoding="utf-8"
+    ).decode()
+
+
+def _dict_to_etree(config):
+    if len(config) != 1:
+        raise ValueError("Document must have exactly one root")
+
+    name, value = next(iter(config.items()))
+    if isinstance(value, list):
+        raise ValueError("Document must have exactly one root")
 
-        if value is not None:
-            main_config[key] = value
+    return _create_element(None, name, value, {})
+
+
+def _create_element(parent, name, value, parent_nsmap):
+    nsmap = {}
+    if isinstance(value, Mapping):
+        for key, item in value.items():
+            if key == "@xmlns":
+                nsmap[None] = item
+            elif key.startswith("@xmlns:"):
+                nsmap[key[len("@xmlns:") :]] = item
+
+    full_nsmap = {**parent_nsmap, **nsmap}
+    tag = _qualified_name(name, full_nsmap, use_default_namespace=True)
+    if parent is None:
+        element = etree.Element(tag, nsmap=nsmap or None)
+    else:
+        element = etree.SubElement(parent, tag, nsmap=nsmap or None)
+
+    if isinstance(value, Mapping):
+        for key, item in value.items():
+            if key == "@xmlns" or key.startswith("@xmlns:"):
+                continue
+
+            if key.startswith("@"):
+                attribute = _qualified_name(
+                    key[1:], full_nsmap, use_default_namespace=False
+                )
+                element.set(attribute, _xml_text(item))
+            elif key == "#text":
+                element.text = _xml_text(item)
+            else:
+                for child in item if isinstance(item, list) else [item]:
+                    _create_element(element, key, child, full_nsmap)
+    elif value is not None:
+        element.text = _xml_text(value)
+
+    return element
+
+
+def _qualified_name(name, nsmap, use_default_namespace):
+    prefix, _, localname = name.rpartition(":")
+    if prefix:
+        if prefix not in nsmap:
+            raise ValueError(f"Undefined namespace prefix: {prefix}")
+        return f"{{{nsmap[prefix]}}}{localname}"
+
+    if use_default_namespace and nsmap.get(None):
+        return f"{{{nsmap[None]}}}{name}"
+
+    return name
+
+
+def _xml_text(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _merge_configs(main_config, additional_configs):
+    """
+    Return main config with additional configs merged into it.
+
+    Passed configs are not modified. Only sections changed by merge are copied, other ones
+    are shared with the passed configs.
+    """
+    # Sections copied during merge, they can be modified in place. Copies are kept here
+    # to guarantee that their ids are not reused.
+    copies: Dict[int, dict] = {}
+
+    def _copy(section):
+        section = dict(section)
+        copies[id(section)] = section
+        return section
+
+    result = _copy(main_config)
+    for additional_config in additional_configs:
+        stack = [(result, additional_config)]
+        while stack:
+            main_section, additional_section = stack.pop()
+            for key, value in additional_section.items():
+                if key not in main_section:
+                    main_section[key] = value
+                    continue
+
+                current = main_section[key]
+                if isinstance(current, dict) and isinstance(value, dict):
+                    if id(current) not in copies:
+                        current = main_section[key] = _copy(current)
+                    stack.append((current, value))
+                    continue
+
+                if value is not None:
+                    main_section[key] = value
+
+    return result
 
 
 def _apply_config_directives(config_section, include_config):
+    """
+    Return config section with resolved include directives. The passed section is not
+    modified, subsections without include directives are shared with it.
+    """
+    replacements = {}
     for key, item in config_section.items():
         if not isinstance(item, dict):
             continue
 
         include = item.get("@incl")
         if include:
-            config_section[key] = include_config[include]
+            replacements[key] = include_config[include]
             continue
 
-        _apply_config_directives(item, include_config)
+        new_item = _apply_config_directives(item, include_config)
+        if new_item is not item:
+            replacements[key] = new_item
+
+    if not replacements:
+        return config_section
+
+    return {**config_section, **replacements}
+
+
+def _mask_secrets_cow(config):
+    """
+    Return config with masked secrets. Only sections containing secrets (and their
+    ancestors) are copied, other ones are shared with the passed config. If there are no
+    secrets, the passed config is returned.
+    """
+    # Stack items are [section, section copy or None, parent item, key in parent].
+    root = [config, None, None, None]
+    stack = [root]
+    while stack:
+        item = stack.pop()
+        for key, value in item[0].items():
+            if isinstance(value, Mapping):
+                stack.append([value, None, item, key])
+            elif key in _SECRET_KEYS:
+                _section_copy(item)[key] = "*****"
+
+    return config if root[1] is None else root[1]
+
+
+def _section_copy(item):
+    """
+    Return copy of the section from stack item of _mask_secrets_cow. The copy is created
+    on the first call along with copies of ancestor sections that are not copied yet.
+    """
+    chain = []
+    current = item
+    while current is not None and current[1] is None:
+        chain.append(current)
+        current = current[2]
 
+    for current in reversed(chain):
+        current[1] = dict(current[0])
+        if current[2] is not None:
+            current[2][1][current[3]] = current[1]
 
-def _mask_secrets(config):
-    if isinstance(config, MutableMapping):
-        for key, value in list(config.items()):
-            if isinstance(value, MutableMapping):
-                _mask_secrets(config[key])
-            elif key in ("password", "secret_access_key", "header", "identity"):
-                config[key] = "*****"
+    return item[1]
@@ -1,5 +1,4 @@
 import os.path
-import socket
 from copy import deepcopy
 
 from ch_tools.common.utils import deep_merge
@@ -19,7 +18,8 @@ S3_LOG_CONFIG = {
 
 DEFAULT_CONFIG = {
     "clickhouse": {
-        "host": socket.getfqdn(),
+        # Resolved to FQDN of the local host on client creation.
+        "host": None,
         "protocol": "https",
         "insecure": False,
         "port": 8443,
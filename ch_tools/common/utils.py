@@ -1,8 +1,12 @@
 import os
 import re
+import socket
 import subprocess
+from functools import lru_cache
 from pathlib import Path
 
+_MULTIPLE_WS_RE = re.compile(r"\s{2,}")
+
 
 def version_ge(version1, version2):
     """
@@ -23,7 +27,7 @@ def strip_query(query_text: str) -> str:
     Remove query without newlines and duplicate whitespaces.
     Copy from ch-backup/ch-backup/util.py
     """
-    return re.sub(r"\s{2,}", " ", query_text.replace("\n", " ")).strip()
+    return _MULTIPLE_WS_RE.sub(" ", query_text.replace("\n", " ")).strip()
 
 
 def clear_empty_directories_recursively(directory):
@@ -75,6 +79,14 @@ def deep_merge(dest, update):
     return dest
 
 
+@lru_cache(maxsize=1)
+def get_fqdn():
+    """
+    Return FQDN of the local host. The result is cached as resolving can be slow.
+    """
+    return socket.getfqdn()
+
+
 def first_key(mapping):
     return next(iter(mapping.keys()))
 
@@ -1,7 +1,19 @@
 import click
 
-from ch_tools.common.clickhouse.client.clickhouse_client import clickhouse_client
 from ch_tools.common.result import CRIT, OK, Result
+from ch_tools.monrun_checks.query_dispatcher import (
+    query_check_data,
+    register_check_query,
+)
+
+register_check_query(
+    "ro-replica",
+    """
+    SELECT database, table, replica_path, last_queue_update_exception, zookeeper_exception
+    FROM system.replicas WHERE is_readonly
+    """,
+    query_cache=True,
+)
 
 
 @click.command("ro-replica")
@@ -16,11 +28,7 @@ def ro_replica_command(ctx, verbose=False):
     """
     Check for readonly replicated tables.
     """
-    query = """
-        SELECT database, table, replica_path, last_queue_update_exception, zookeeper_exception
-        FROM system.replicas WHERE is_readonly
-    """
-    response = clickhouse_client(ctx).query_json_data(query, compact=False)
+    response = query_check_data(ctx, "ro-replica")
     if response:
         msg_verbose = ""
 
@@ -1,7 +1,16 @@
 from cloup import command, option, pass_context
 
-from ch_tools.common.clickhouse.client.clickhouse_client import clickhouse_client
 from ch_tools.common.result import CRIT, OK, WARNING, Result
+from ch_tools.monrun_checks.query_dispatcher import (
+    query_check_data,
+    register_check_query,
+)
+
+register_check_query(
+    "system-queues",
+    "SELECT database, table, future_parts, parts_to_check, queue_size,"
+    " inserts_in_queue, merges_in_queue FROM system.replicas",
+)
 
 
 @command("system-queues")
@@ -73,8 +82,4 @@ def _get_metrics(ctx):
     """
     Select and return metrics form system.replicas.
     """
-    query = (
-        "SELECT database, table, future_parts, parts_to_check, queue_size,"
-        " inserts_in_queue, merges_in_queue FROM system.replicas"
-    )
-    return clickhouse_client(ctx).query_json_data(query=query, compact=False)
+    return query_check_data(ctx, "system-queues")
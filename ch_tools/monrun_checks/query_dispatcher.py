@@ -0,0 +1,68 @@
+"""
+Dispatcher of monitoring check queries.
+
+Checks register their queries here. When several checks are executed in one process
+(status command), registered queries are fetched in a single request to ClickHouse.
+"""
+
+from typing import Any, Dict, Iterable, Tuple
+
+import requests
+from click import Context
+
+from ch_tools.common import logging
+from ch_tools.common.clickhouse.client.clickhouse_client import clickhouse_client
+
+_CHECK_QUERIES: Dict[str, Tuple[str, Dict[str, Any]]] = {}
+
+
+def register_check_query(name: str, query: str, **kwargs: Any) -> None:
+    """
+    Register query of the monitoring check. Keyword arguments are passed to
+    ClickhouseClient.query_json_data() when the query is executed separately.
+
+    When queries are prefetched, server-side query cache is used only if it's enabled
+    for all of them. Other options, e.g. client-side result cache, are not applied
+    to prefetched data.
+    """
+    _CHECK_QUERIES[name] = (query, kwargs)
+
+
+def prefetch_check_queries(ctx: Context, names: Iterable[str]) -> None:
+    """
+    Execute registered queries of the specified checks in a single request.
+    """
+    names = [name for name in names if name in _CHECK_QUERIES]
+    if len(names) < 2:
+        return
+
+    queries = [(name, _CHECK_QUERIES[name][0]) for name in names]
+    query_cache = all(_CHECK_QUERIES[name][1].get("query_cache") for name in names)
+    try:
+        ctx.obj["prefetched_check_data"] = clickhouse_client(ctx).batch(
+            queries, query_cache=query_cache or None
+        )
+    except requests.exceptions.ConnectionError as e:
+        # The request was already retried, so checks report the error without retrying
+        # their queries once again.
+        logging.warning("Failed to prefetch check queries: {!r}", e)
+        ctx.obj["prefetch_check_errors"] = dict.fromkeys(names, e)
+    except Exception as e:
+        # Checks fall back to executing their queries separately and report errors on their own.
+        logging.warning("Failed to prefetch check queries: {!r}", e)
+
+
+def query_check_data(ctx: Context, name: str) -> Any:
+    """
+    Return data of the registered check query. Prefetched data is used if present.
+    """
+    error = ctx.obj.get("prefetch_check_errors", {}).pop(name, None)
+    if error is not None:
+        raise error
+
+    prefetched = ctx.obj.get("prefetched_check_data", {})
+    if name in prefetched:
+        return prefetched.pop(name)
+
+    query, kwargs = _CHECK_QUERIES[name]
+    return clickhouse_client(ctx).query_json_data(query, compact=False, **kwargs)
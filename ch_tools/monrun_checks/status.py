@@ -1,6 +1,8 @@
 import click
 import tabulate
 
+from ch_tools.monrun_checks.query_dispatcher import prefetch_check_queries
+
 DEFAULT_COLOR = "\033[0m"
 
 COLOR_MAP = {
@@ -21,16 +23,20 @@ def status_command(commands):
         ctx.obj["status_mode"] = True
         ctx.default_map = config
 
+        enabled_commands = [
+            cmd for cmd in commands if not config.get(cmd.name, {}).get("@disabled")
+        ]
+        prefetch_check_queries(ctx, [cmd.name for cmd in enabled_commands])
+
         checks_status = []
-        for cmd in commands:
-            if not config.get(cmd.name, {}).get("@disabled"):
-                status = ctx.invoke(cmd)
-                checks_status.append(
-                    (
-                        cmd.name,
-                        f"{COLOR_MAP[status.code]}{status.message}{DEFAULT_COLOR}",
-                    )
+        for cmd in enabled_commands:
+            status = ctx.invoke(cmd)
+            checks_status.append(
+                (
+                    cmd.name,
+                    f"{COLOR_MAP[status.code]}{status.message}{DEFAULT_COLOR}",
                 )
+            )
 
         print(tabulate.tabulate(checks_status))
 
@@ -0,0 +1,295 @@
+import asyncio
+import json
+import time
+from unittest.mock import Mock, patch
+
+import pytest
+import requests
+
+from ch_tools.common.clickhouse.client.clickhouse_client import (
+    ClickhouseClient,
+    ClickhousePort,
+    _compile_query_template,
+    _json_loads,
+    _render_simple_query,
+)
+from ch_tools.common.clickhouse.client.error import ClickhouseError
+from ch_tools.common.clickhouse.client.query_cache import QUERY_CACHE_SETTINGS
+
+# type: ignore
+
+
+@pytest.fixture(autouse=True)
+def logging_mock():
+    with patch("ch_tools.common.clickhouse.client.clickhouse_client.logging"):
+        yield
+
+
+def _client(**kwargs):
+    client = ClickhouseClient(
+        host="localhost",
+        ports={ClickhousePort.HTTP: 8123},
+        timeout=10,
+        **kwargs,
+    )
+    client._session = Mock()
+    return client
+
+
+def _response(text="", status_code=200, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response._content = text.encode()
+    response.headers.update(headers or {})
+    return response
+
+
+def _unknown_setting_response(setting):
+    return _response(
+        f"Code: 115. DB::Exception: Unknown setting {setting}. (UNKNOWN_SETTING)",
+        status_code=404,
+        headers={"X-ClickHouse-Exception-Code": "115"},
+    )
+
+
+def _sent_settings(client, call_index):
+    params = client._session.post.call_args_list[call_index][1]["params"]
+    return {
+        name
+        for name in params
+        if name.startswith("query_cache") or name.startswith("use_query_cache")
+    }
+
+
+def test_query_cache_settings_fallback():
+    client = _client(query_cache=True)
+    client._session.post.side_effect = [
+        _unknown_setting_response("query_cache_system_table_handling"),
+        _response("1"),
+        _response("1"),
+    ]
+
+    assert client.query("SELECT 1") == "1"
+    assert client.query("SELECT 1") == "1"
+
+    assert _sent_settings(client, 0) == {
+        "use_query_cache",
+        "query_cache_ttl",
+        "query_cache_system_table_handling",
+    }
+    # Unsupported setting is not sent on retry and in subsequent queries.
+    assert _sent_settings(client, 1) == {"use_query_cache", "query_cache_ttl"}
+    assert _sent_settings(client, 2) == {"use_query_cache", "query_cache_ttl"}
+
+
+def test_query_cache_not_supported():
+    client = _client(query_cache=True)
+    client._session.post.side_effect = [
+        _unknown_setting_response("use_query_cache"),
+        _response("1"),
+    ]
+
+    assert client.query("SELECT 1") == "1"
+    assert _sent_settings(client, 1) == set()
+
+
+def test_query_cache_readonly_user():
+    client = _client(query_cache=True)
+    client._session.post.side_effect = [
+        _response(
+            "Code: 164. DB::Exception: Cannot modify 'use_query_cache' setting"
+            " in readonly mode. (READONLY)",
+            status_code=500,
+            headers={"X-ClickHouse-Exception-Code": "164"},
+        ),
+        _response("1"),
+    ]
+
+    assert client.query("SELECT 1") == "1"
+    assert _sent_settings(client, 1) == set()
+
+
+def test_query_cache_unrelated_unknown_setting():
+    client = _client(query_cache=True)
+    client._session.post.return_value = _unknown_setting_response("max_threadz")
+
+    with pytest.raises(ClickhouseError):
+        client.query("SELECT 1", settings={"max_threadz": 1})
+
+    # The query is not retried and query cache stays enabled.
+    assert client._session.post.call_count == 1
+    assert client._server_query_cache.settings == QUERY_CACHE_SETTINGS
+
+
+def test_aquery_concurrent():
+    client = _client(query_cache=True)
+
+    def post(url, params, **kwargs):
+        time.sleep(0.01)
+        if "query_cache_system_table_handling" in params:
+            return _unknown_setting_response("query_cache_system_table_handling")
+        if params["query"] == "SELECT version()":
+            return _response("23.8.1.1")
+        return _response(params["query"])
+
+    client._session.post.side_effect = post
+
+    async def run():
+        return await asyncio.gather(
+            *(
+                client.aquery(
+                    "SELECT {{ 1 if version_ge('23.3') else 0 }} + {{ value }}",
+                    query_args={"value": i},
+                )
+                for i in range(8)
+            )
+        )
+
+    loop = asyncio.new_event_loop()
+    try:
+        results = loop.run_until_complete(run())
+    finally:
+        loop.close()
+
+    assert results == [f"SELECT 1 + {i}" for i in range(8)]
+    version_queries = [
+        call
+        for call in client._session.post.call_args_list
+        if call[1]["params"]["query"] == "SELECT version()"
+    ]
+    # The version is requested once, the first attempt is rejected by server.
+    assert len(version_queries) == 2
+    assert client._server_query_cache.settings == {
+        "use_query_cache": 1,
+        "query_cache_ttl": 30,
+    }
+
+
+def test_query_json_requested_as_json_compact():
+    client = _client()
+    client._session.post.return_value = _response(
+        """{
+            "meta": [{"name": "name", "type": "String"}, {"name": "count", "type": "UInt64"}],
+            "data": [["a", "1"], ["b", "2"]],
+            "totals": ["", "3"],
+            "extremes": {"min": ["a", "1"], "max": ["b", "2"]},
+            "rows": 2
+        }"""
+    )
+
+    result = client.query("SELECT name, count() AS count FROM t", format_="JSON")
+
+    params = client._session.post.call_args[1]["params"]
+    assert params["query"].endswith("FORMAT JSONCompact")
+    assert result == {
+        "meta": [
+            {"name": "name", "type": "String"},
+            {"name": "count", "type": "UInt64"},
+        ],
+        "data": [{"name": "a", "count": "1"}, {"name": "b", "count": "2"}],
+        "totals": {"name": "", "count": "3"},
+        "extremes": {
+            "min": {"name": "a", "count": "1"},
+            "max": {"name": "b", "count": "2"},
+        },
+        "rows": 2,
+    }
+
+
+def test_batch():
+    client = _client()
+    client._session.post.return_value = _response(
+        "\n".join(
+            [
+                '{"_check_name":"first","_check_row":"{\\"name\\":\\"a\\",\\"value\\":1}"}',
+                '{"_check_name":"first","_check_row":"{\\"name\\":\\"b\\",\\"value\\":2}"}',
+                '{"_check_name":"second","_check_row":"{\\"count\\":\\"3\\"}"}',
+            ]
+        )
+    )
+
+    result = client.batch(
+        [
+            ("first", "SELECT name, value FROM t"),
+            ("second", "SELECT count() AS count FROM t"),
+            ("third", "SELECT name FROM t WHERE 0"),
+        ]
+    )
+
+    assert result == {
+        "first": [{"name": "a", "value": 1}, {"name": "b", "value": 2}],
+        "second": [{"count": "3"}],
+        "third": [],
+    }
+    params = client._session.post.call_args[1]["params"]
+    assert params["query"] == (
+        "SELECT 'first' AS _check_name,"
+        " formatRowNoNewline('JSONEachRow', *) AS _check_row"
+        " FROM (SELECT name, value FROM t)"
+        " UNION ALL SELECT 'second' AS _check_name,"
+        " formatRowNoNewline('JSONEachRow', *) AS _check_row"
+        " FROM (SELECT count() AS count FROM t)"
+        " UNION ALL SELECT 'third' AS _check_name,"
+        " formatRowNoNewline('JSONEachRow', *) AS _check_row"
+        " FROM (SELECT name FROM t WHERE 0)"
+        " FORMAT JSONEachRow"
+    )
+
+
+def test_query_result_cache():
+    client = _client()
+    client._session.post.return_value = _response(
+        '{"meta": [{"name": "value", "type": "UInt8"}], "data": [[1]], "rows": 1}'
+    )
+
+    compact = client.query("SELECT 1 AS value", format_="JSONCompact", cache=True)
+    result = client.query("SELECT 1 AS value", format_="JSON", cache=True)
+
+    # Both results are served by a single query as they share the wire format.
+    assert client._session.post.call_count == 1
+    assert compact["data"] == [[1]]
+    assert result["data"] == [{"value": 1}]
+
+
+@pytest.mark.parametrize(
+    ["query", "variables", "simple"],
+    [
+        ("SELECT 1", {}, True),
+        ("SELECT {{ value }}, {{value}}\n", {"value": 1}, True),
+        ("SELECT '{{ name }}'\n\n", {"name": "a"}, True),
+        ("SELECT {{ value }}", {"value": None}, True),
+        ("SELECT {{ value }}\r\nFROM t\r\n", {"value": 1}, False),
+        ("SELECT 1\rFROM t", {}, False),
+        ("SELECT {{ value }}", {}, False),
+        ("SELECT {{ none }}", {"none": 1}, False),
+        ("SELECT {{ value + 1 }}", {"value": 1}, False),
+        ("SELECT {% if value %}1{% endif %}", {"value": 1}, False),
+        ("SELECT 1 {# comment #}", {}, False),
+    ],
+)
+def test_render_simple_query(query, variables, simple):
+    rendered = _render_simple_query(query, variables)
+    if simple:
+        assert rendered == _compile_query_template(query).render(variables)
+    else:
+        assert rendered is None
+
+
+@pytest.mark.parametrize(
+    "data",
+    [
+        '{"data": [[18446744073709551615, -9223372036854775808, 1.5, "a"]]}',
+        '{"data": [[18446744073709551616, -9223372036854775809]]}',
+        '{"data": [[340282366920938463463374607431768211455]]}',
+        '{"data": [["123456789012345678901234567890"]]}',
+    ],
+)
+def test_json_loads(data):
+    expected = json.loads(data)
+    assert _json_loads(data) == expected
+    assert _json_loads(data.encode()) == expected
+
+
+def test_json_loads_invalid_utf8():
+    data = b'{"data": [{"s": "ab\xff\xfecd"}]}'
+    assert _json_loads(data) == {"data": [{"s": "ab��cd"}]}
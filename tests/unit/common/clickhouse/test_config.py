@@ -1,10 +1,12 @@
 import pytest
+import xmltodict
 
 from ch_tools.common.clickhouse.config import ClickhouseConfig
 from ch_tools.common.clickhouse.config.path import (
     CLICKHOUSE_SERVER_CONFIG_PATH,
     CLICKHOUSE_SERVER_PREPROCESSED_CONFIG_PATH,
 )
+from ch_tools.common.clickhouse.config.utils import dump_config, load_config
 
 # type: ignore
 
@@ -128,3 +130,88 @@ def test_config(fs, files, result):
 
     config = ClickhouseConfig.load(try_preprocessed=True)
     assert config.dump() == result
+    assert xmltodict.parse(config.dump_xml()) == result
+
+
+def test_load_config_layout(fs):
+    contents = """<?xml version="1.0"?>
+        <!-- comment -->
+        <clickhouse xmlns:xi="http://www.w3.org/2001/XInclude">
+            <text attr="1">text<!-- comment --> more</text>
+            <mixed>a<b>1</b>b<b>2</b>c<c/>d</mixed>
+            <items><item>1</item><item>2</item><item>3</item><other/></items>
+            <xi:include href="file.xml"/>
+            <empty>  </empty>
+            <escaped>&amp;&lt;</escaped>
+        </clickhouse>
+        """
+    fs.create_file("/etc/config.xml", contents=contents)
+
+    assert load_config("/etc/config.xml") == xmltodict.parse(contents.strip())
+
+
+def test_config_reload(fs):
+    fs.create_file(
+        CLICKHOUSE_SERVER_CONFIG_PATH,
+        contents="""
+            <clickhouse>
+                <path>/var/lib/clickhouse/</path>
+            </clickhouse>
+            """,
+    )
+    disks = {
+        "/etc/clickhouse-server/config.d/s3.xml": "s3",
+        "/etc/clickhouse-server/config.d/s3_cold.xml": "s3_cold",
+    }
+    for file_path, disk in disks.items():
+        fs.create_file(
+            file_path,
+            contents=f"""
+                <clickhouse>
+                    <storage_configuration>
+                        <disks>
+                            <{disk}><type>s3</type></{disk}>
+                        </disks>
+                    </storage_configuration>
+                </clickhouse>
+                """,
+        )
+
+    config = ClickhouseConfig.load()
+    assert config.dump()["clickhouse"]["storage_configuration"]["disks"] == {
+        "s3": {"type": "s3"},
+        "s3_cold": {"type": "s3"},
+    }
+
+    # Cached parse results of files must not be affected by merging of config files.
+    for file_path, disk in disks.items():
+        fs.rename(file_path, "/tmp/disk.xml")
+        config = ClickhouseConfig.load()
+        fs.rename("/tmp/disk.xml", file_path)
+        expected_disk = "s3_cold" if disk == "s3" else "s3"
+        assert config.dump()["clickhouse"]["storage_configuration"]["disks"] == {
+            expected_disk: {"type": "s3"},
+        }
+
+
+def test_dump_config_mask_secrets():
+    config = {
+        "clickhouse": {
+            "rabbitmq": {"username": "user1", "password": "password1"},
+            "macros": {"cluster": "cluster1"},
+        },
+    }
+
+    result = dump_config(config)
+    assert result == {
+        "clickhouse": {
+            "rabbitmq": {"username": "user1", "password": "*****"},
+            "macros": {"cluster": "cluster1"},
+        },
+    }
+    # Source config is not modified, sections without secrets are shared.
+    assert config["clickhouse"]["rabbitmq"]["password"] == "password1"
+    assert result["clickhouse"]["macros"] is config["clickhouse"]["macros"]
+
+    config_without_secrets = {"clickhouse": {"path": "/var/lib/clickhouse/"}}
+    assert dump_config(config_without_secrets) is config_without_secrets
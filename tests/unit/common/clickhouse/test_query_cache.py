@@ -0,0 +1,35 @@
+from ch_tools.common.clickhouse.client.query_cache import QueryResultCache
+
+# type: ignore
+
+
+def test_query_cache_hit():
+    cache = QueryResultCache(maxsize=2, ttl=60)
+    cache.put("key", {"data": [1]})
+
+    found, value = cache.get("key")
+    assert found
+    assert value == {"data": [1]}
+
+    # Cached value must not be affected by modifications of returned one.
+    value["data"].append(2)
+    assert cache.get("key") == (True, {"data": [1]})
+
+
+def test_query_cache_eviction():
+    cache = QueryResultCache(maxsize=2, ttl=60)
+    cache.put("key1", "value1")
+    cache.put("key2", "value2")
+    cache.get("key1")
+    cache.put("key3", "value3")
+
+    assert cache.get("key1") == (True, "value1")
+    assert cache.get("key2") == (False, None)
+    assert cache.get("key3") == (True, "value3")
+
+
+def test_query_cache_expiration():
+    cache = QueryResultCache(maxsize=2, ttl=0)
+    cache.put("key", "value")
+
+    assert cache.get("key") == (False, None)
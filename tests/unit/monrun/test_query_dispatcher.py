@@ -0,0 +1,82 @@
+from unittest.mock import Mock, patch
+
+import pytest
+import requests
+
+from ch_tools.monrun_checks import query_dispatcher
+from ch_tools.monrun_checks.query_dispatcher import (
+    prefetch_check_queries,
+    query_check_data,
+    register_check_query,
+)
+
+# type: ignore
+
+
+@pytest.fixture(autouse=True)
+def check_queries():
+    with patch.dict(query_dispatcher._CHECK_QUERIES, clear=True):
+        register_check_query("first", "SELECT 1 AS value", query_cache=True)
+        register_check_query("second", "SELECT 2 AS value")
+        yield
+
+
+@pytest.fixture()
+def ctx():
+    return Mock(obj={"chcli": Mock()})
+
+
+def test_prefetched_data(ctx):
+    client = ctx.obj["chcli"]
+    client.batch.return_value = {"first": [{"value": 1}], "second": [{"value": 2}]}
+
+    prefetch_check_queries(ctx, ["first", "second", "unknown"])
+
+    client.batch.assert_called_once_with(
+        [("first", "SELECT 1 AS value"), ("second", "SELECT 2 AS value")],
+        query_cache=None,
+    )
+    assert query_check_data(ctx, "first") == [{"value": 1}]
+    assert query_check_data(ctx, "second") == [{"value": 2}]
+    client.query_json_data.assert_not_called()
+
+
+def test_fallback_to_separate_query(ctx):
+    client = ctx.obj["chcli"]
+    client.query_json_data.return_value = [{"value": 1}]
+
+    # Prefetching of a single query is skipped.
+    prefetch_check_queries(ctx, ["first"])
+    client.batch.assert_not_called()
+
+    assert query_check_data(ctx, "first") == [{"value": 1}]
+    client.query_json_data.assert_called_once_with(
+        "SELECT 1 AS value", compact=False, query_cache=True
+    )
+
+
+def test_fallback_on_prefetch_failure(ctx):
+    client = ctx.obj["chcli"]
+    client.batch.side_effect = RuntimeError("failure")
+    client.query_json_data.return_value = [{"value": 2}]
+
+    with patch.object(query_dispatcher, "logging"):
+        prefetch_check_queries(ctx, ["first", "second"])
+
+    assert query_check_data(ctx, "second") == [{"value": 2}]
+    client.query_json_data.assert_called_once_with("SELECT 2 AS value", compact=False)
+
+
+def test_prefetch_connection_error(ctx):
+    client = ctx.obj["chcli"]
+    error = requests.exceptions.ConnectionError("connection refused")
+    client.batch.side_effect = error
+
+    with patch.object(query_dispatcher, "logging"):
+        prefetch_check_queries(ctx, ["first", "second"])
+
+    # Unreachable server is reported by checks without retrying queries once again.
+    for name in ("first", "second"):
+        with pytest.raises(requests.exceptions.ConnectionError):
+            query_check_data(ctx, name)
+    client.query_json_data.assert_not_called()